@@ -18,17 +18,30 @@ Required environment variable:
     FIGMA_TOKEN - Your Figma personal access token
     
 Or edit the CONFIG section below.
+
+Requires urllib3 (pip install urllib3). If orjson is installed it is used
+to parse the (often multi-MB) file document.
 """
 
 import os
 import re
 import sys
 import json
-import time
-import urllib.request
-import urllib.error
+import shutil
+import hashlib
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import urllib3
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # CONFIG - Edit these values
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -45,6 +58,9 @@ PAGE_NAME = "Icons — Export"
 # Output directory for exported SVGs
 OUTPUT_DIR = Path(__file__).parent.parent / "icons" / "raw"
 
+# Local cache of full file structures, keyed by file key and version
+CACHE_DIR = Path.home() / ".cache" / "figma-export"
+
 # Export settings
 EXPORT_SETTINGS = {
     "format": "svg",
@@ -55,31 +71,141 @@ EXPORT_SETTINGS = {
     "use_absolute_bounds": True,    # Use frame bounds, not selection bounds
 }
 
+# Number of node IDs sent per images/ export request
+EXPORT_BATCH_SIZE = 50
+
+# Maximum number of SVG downloads in flight at once
+DOWNLOAD_CONCURRENCY = 16
+
+# Retry transient failures and rate limiting with exponential backoff,
+# honouring Retry-After, so the happy path never sleeps
+_RETRY = urllib3.Retry(
+    total=5,
+    backoff_factor=0.25,
+    status_forcelist=(429, 500, 502, 503, 504),
+    respect_retry_after_header=True,
+    allowed_methods=frozenset(["GET", "HEAD"]),
+    raise_on_status=False,
+)
+
+# Shared connection pool so every request reuses kept-alive TLS connections
+# to api.figma.com and the image CDN instead of handshaking per call.
+# block=True makes bursts (e.g. many export batches at once) wait for a
+# pooled connection rather than opening extra ones that are discarded after
+# a single request, so each host costs at most DOWNLOAD_CONCURRENCY handshakes.
+_POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=DOWNLOAD_CONCURRENCY,
+    block=True,
+    retries=_RETRY,
+)
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # FIGMA API HELPERS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def figma_request(endpoint: str) -> dict:
-    """Make an authenticated request to the Figma API."""
+class FigmaHTTPError(Exception):
+    """An HTTP error response from the Figma API."""
+    
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"HTTP {status} - {reason}")
+        self.status = status
+        self.reason = reason
+
+
+def _figma_get(endpoint: str) -> dict:
+    """Make an authenticated request to the Figma API, raising FigmaHTTPError on failure."""
     url = f"https://api.figma.com/v1/{endpoint}"
     headers = {"X-Figma-Token": FIGMA_TOKEN}
     
-    req = urllib.request.Request(url, headers=headers)
+    response = _POOL.request("GET", url, headers=headers)
     
+    if response.status >= 400:
+        raise FigmaHTTPError(response.status, response.reason)
+    
+    return _json_loads(response.data)
+
+
+def report_http_error(error: FigmaHTTPError) -> None:
+    """Print a Figma API error and a hint for the common causes."""
+    print(f"Error: {error}")
+    if error.status == 403:
+        print("Check your FIGMA_TOKEN is valid and has access to this file.")
+
+
+def figma_request(endpoint: str) -> dict:
+    """Make an authenticated request to the Figma API, exiting on failure."""
     try:
-        with urllib.request.urlopen(req) as response:
-            return json.loads(response.read().decode())
-    except urllib.error.HTTPError as e:
-        print(f"Error: HTTP {e.code} - {e.reason}")
-        if e.code == 403:
-            print("Check your FIGMA_TOKEN is valid and has access to this file.")
+        return _figma_get(endpoint)
+    except FigmaHTTPError as e:
+        report_http_error(e)
         sys.exit(1)
 
 
+async def figma_request_async(endpoint: str) -> dict:
+    """
+    Run a Figma API request in a worker thread so several can be awaited together.
+    
+    Raises FigmaHTTPError rather than exiting: SystemExit raised in a worker
+    thread escapes through the task as a traceback instead of a clean exit.
+    """
+    return await asyncio.to_thread(_figma_get, endpoint)
+
+
 def get_file_structure(file_key: str) -> dict:
-    """Get the full file structure from Figma."""
+    """
+    Get the full file structure from Figma.
+    
+    A cheap depth=1 request fetches the current file version first; if that
+    version is already cached on disk, the full document isn't re-downloaded.
+    """
     print(f"Fetching file structure for {file_key}...")
-    return figma_request(f"files/{file_key}")
+    version = figma_request(f"files/{file_key}?depth=1").get("version")
+    
+    if version:
+        cache_path = CACHE_DIR / f"{file_key}.{version}.json"
+        try:
+            file_data = _json_loads(cache_path.read_bytes())
+            print(f"Using cached file structure (version {version})")
+            return file_data
+        except (FileNotFoundError, ValueError):
+            pass
+    
+    file_data = figma_request(f"files/{file_key}")
+    
+    # Key the cache by the version actually fetched, in case it moved
+    # between the two requests
+    version = file_data.get("version")
+    if version:
+        write_cached_structure(file_key, version, file_data)
+    
+    return file_data
+
+
+def write_cached_structure(file_key: str, version: str, file_data: dict) -> None:
+    """
+    Cache a file structure for this version and drop older versions.
+    
+    Written through a temp file and os.replace so an interrupted run never
+    leaves a truncated cache file. Only the current version can be read
+    again, so every other {file_key}.*.json is removed once it's in place.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_path = CACHE_DIR / f"{file_key}.{version}.json"
+    
+    fd, part_name = tempfile.mkstemp(dir=CACHE_DIR, prefix=f"{file_key}.", suffix=".json.part")
+    part_path = Path(part_name)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(file_data, f)
+        os.replace(part_path, cache_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    
+    for old_path in CACHE_DIR.glob(f"{file_key}.*.json"):
+        if old_path != cache_path:
+            old_path.unlink(missing_ok=True)
 
 
 def find_page_by_name(document: dict, page_name: str) -> dict | None:
@@ -92,41 +218,48 @@ def find_page_by_name(document: dict, page_name: str) -> dict | None:
 
 def collect_icon_frames(node: dict, icons: list, depth: int = 0) -> None:
     """
-    Recursively collect all frames that appear to be icons.
+    Collect all frames that appear to be icons.
     
     Icons are identified as:
     - FRAME or COMPONENT type
     - At the top level of the page (depth == 0) or inside a section
     - Have reasonable icon-like dimensions
-    """
-    node_type = node.get("type", "")
-    name = node.get("name", "")
     
-    # Skip hidden nodes
-    if node.get("visible") == False:
-        return
+    Walks the tree with an explicit stack rather than recursion, so deep
+    Figma documents can't hit the recursion limit. Children are pushed in
+    reverse so icons are still collected in document order.
+    """
+    stack = [(node, depth)]
     
-    # Collect frames/components at depth 0 or 1 (direct children or in sections)
-    if node_type in ("FRAME", "COMPONENT", "COMPONENT_SET") and depth <= 1:
-        # Get absolute bounds if available
-        bounds = node.get("absoluteBoundingBox", {})
-        width = bounds.get("width", 0)
-        height = bounds.get("height", 0)
+    while stack:
+        node, depth = stack.pop()
+        node_type = node.get("type", "")
+        name = node.get("name", "")
         
-        # Typical icon sizes: 12, 16, 20, 24, 28, 32, 48, etc.
-        if 8 <= width <= 128 and 8 <= height <= 128:
-            icons.append({
-                "id": node.get("id"),
-                "name": name,
-                "width": width,
-                "height": height,
-            })
-            return  # Don't recurse into icon frames
-    
-    # Recurse into children
-    for child in node.get("children", []):
+        # Skip hidden nodes
+        if node.get("visible") == False:
+            continue
+        
+        # Collect frames/components at depth 0 or 1 (direct children or in sections)
+        if node_type in ("FRAME", "COMPONENT", "COMPONENT_SET") and depth <= 1:
+            # Get absolute bounds if available
+            bounds = node.get("absoluteBoundingBox", {})
+            width = bounds.get("width", 0)
+            height = bounds.get("height", 0)
+            
+            # Typical icon sizes: 12, 16, 20, 24, 28, 32, 48, etc.
+            if 8 <= width <= 128 and 8 <= height <= 128:
+                icons.append({
+                    "id": node.get("id"),
+                    "name": name,
+                    "width": width,
+                    "height": height,
+                })
+                continue  # Don't descend into icon frames
+        
+        # Descend into children
         new_depth = depth + 1 if node_type in ("SECTION", "FRAME") else depth
-        collect_icon_frames(child, icons, new_depth)
+        stack.extend((child, new_depth) for child in reversed(node.get("children", [])))
 
 
 def sanitize_filename(name: str) -> str:
@@ -141,7 +274,96 @@ def sanitize_filename(name: str) -> str:
     return safe or "unnamed"
 
 
-def export_icons(file_key: str, icons: list) -> None:
+def svg_is_current(url: str, filepath: Path) -> bool:
+    """
+    Check with a HEAD request whether filepath already holds the SVG at url.
+    
+    Only a strong validator counts: the local MD5 must match an ETag that is
+    a plain MD5 digest (as S3 serves for single-part objects). Any other ETag,
+    or a failed HEAD, means "download it" -- this check is only a shortcut,
+    and equal sizes don't prove equal content (M12.5 -> M12.7).
+    """
+    if not filepath.exists():
+        return False
+    
+    try:
+        response = _POOL.request("HEAD", url)
+    except Exception:
+        return False
+    
+    if response.status != 200:
+        return False
+    
+    etag = response.headers.get("ETag", "").strip('"')
+    if not re.fullmatch(r'[0-9a-f]{32}', etag):
+        return False
+    
+    return hashlib.md5(filepath.read_bytes(), usedforsecurity=False).hexdigest() == etag
+
+
+def download_svg(url: str, filepath: Path) -> bool:
+    """
+    Download a single SVG and stream it to disk.
+    
+    Returns False without downloading if the file on disk is already current.
+    """
+    if svg_is_current(url, filepath):
+        return False
+    
+    response = _POOL.request("GET", url, preload_content=False)
+    
+    try:
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status} - {response.reason}")
+        
+        # Stream into a sibling temp file and only replace the existing SVG once
+        # the whole body has arrived, so a dropped connection never leaves a
+        # truncated file behind. The temp name is unique per call, so concurrent
+        # downloads never share (and truncate) each other's partial file.
+        fd, part_name = tempfile.mkstemp(
+            dir=filepath.parent, prefix=filepath.stem + ".", suffix=".svg.part"
+        )
+        part_path = Path(part_name)
+        
+        try:
+            # SVGs are UTF-8 on the wire and on disk, so copy the bytes straight through
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(response, f, 65536)
+            
+            # mkstemp creates files 0600; keep exported SVGs world-readable
+            os.chmod(part_path, 0o644)
+            os.replace(part_path, filepath)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+    finally:
+        response.release_conn()
+    
+    return True
+
+
+async def _fetch_one(url: str, filepath: Path, sem: asyncio.Semaphore) -> str | None:
+    """
+    Download one icon, holding the semaphore while the request is in flight.
+    
+    Returns "downloaded", "unchanged", or None on failure.
+    """
+    async with sem:
+        try:
+            downloaded = await asyncio.to_thread(download_svg, url, filepath)
+        except Exception as e:
+            print(f"  ✗ {filepath.name}: {e}")
+            return None
+    
+    if not downloaded:
+        print(f"  = {filepath.name} (unchanged)")
+        return "unchanged"
+    
+    print(f"  ✓ {filepath.name}")
+    return "downloaded"
+
+
+async def export_icons(file_key: str, icons: list) -> None:
     """Export all icons as SVG files."""
     if not icons:
         print("No icons found to export.")
@@ -149,13 +371,17 @@ def export_icons(file_key: str, icons: list) -> None:
     
     print(f"\nExporting {len(icons)} icons...")
     
+    # asyncio.to_thread runs on the loop's default executor, which is sized
+    # from the CPU count; size it to DOWNLOAD_CONCURRENCY so the semaphore and
+    # _POOL's maxsize describe the real limit. asyncio.run shuts it down.
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY))
+    
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Build export URL parameters
-    ids = ",".join(icon["id"] for icon in icons)
+    # Build export URL parameters shared by every batch
     params = [
-        f"ids={ids}",
         f"format={EXPORT_SETTINGS['format']}",
         f"svg_outline_text={'true' if EXPORT_SETTINGS['svg_outline_text'] else 'false'}",
         f"svg_include_id={'true' if EXPORT_SETTINGS['svg_include_id'] else 'false'}",
@@ -163,19 +389,36 @@ def export_icons(file_key: str, icons: list) -> None:
         f"use_absolute_bounds={'true' if EXPORT_SETTINGS['use_absolute_bounds'] else 'false'}",
     ]
     
-    endpoint = f"images/{file_key}?{'&'.join(params)}"
-    
-    print("Requesting export URLs from Figma...")
-    result = figma_request(endpoint)
+    # Split the IDs into batches so no single request exceeds Figma's limits
+    chunks = [icons[i:i + EXPORT_BATCH_SIZE] for i in range(0, len(icons), EXPORT_BATCH_SIZE)]
+    endpoints = []
+    for chunk in chunks:
+        ids = ",".join(icon["id"] for icon in chunk)
+        endpoints.append(f"images/{file_key}?ids={ids}&{'&'.join(params)}")
     
-    if result.get("err"):
-        print(f"Error from Figma: {result['err']}")
-        sys.exit(1)
+    print(f"Requesting export URLs from Figma ({len(endpoints)} batches)...")
+    results = await asyncio.gather(
+        *(figma_request_async(ep) for ep in endpoints),
+        return_exceptions=True,
+    )
     
-    images = result.get("images", {})
+    images = {}
+    for result in results:
+        if isinstance(result, FigmaHTTPError):
+            report_http_error(result)
+            sys.exit(1)
+        if isinstance(result, BaseException):
+            raise result
+        if result.get("err"):
+            print(f"Error from Figma: {result['err']}")
+            sys.exit(1)
+        images.update(result.get("images") or {})
     
-    # Download each SVG
-    success_count = 0
+    # Resolve output paths first: names that sanitize to the same filename
+    # would otherwise race each other. The last icon in document order wins,
+    # matching what a sequential download loop would leave on disk.
+    downloads = {}
+    duplicate_count = 0
     for icon in icons:
         node_id = icon["id"]
         name = icon["name"]
@@ -188,24 +431,27 @@ def export_icons(file_key: str, icons: list) -> None:
         filename = sanitize_filename(name) + ".svg"
         filepath = OUTPUT_DIR / filename
         
-        try:
-            # Download the SVG
-            req = urllib.request.Request(url)
-            with urllib.request.urlopen(req) as response:
-                svg_content = response.read().decode('utf-8')
-            
-            # Save to file
-            filepath.write_text(svg_content, encoding='utf-8')
-            print(f"  ✓ {filename}")
-            success_count += 1
-            
-            # Small delay to be nice to the server
-            time.sleep(0.05)
-            
-        except Exception as e:
-            print(f"  ✗ {filename}: {e}")
+        if filepath in downloads:
+            print(f"  ! {filename}: '{name}' replaces '{downloads[filepath][1]}' (same filename)")
+            duplicate_count += 1
+        downloads[filepath] = (url, name)
+    
+    # Download all SVGs concurrently; the semaphore caps requests in flight
+    sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(_fetch_one(url, filepath, sem))
+        for filepath, (url, _) in downloads.items()
+    ]
+    
+    results = await asyncio.gather(*tasks)
+    success_count = sum(1 for status in results if status is not None)
+    unchanged_count = results.count("unchanged")
     
     print(f"\nExported {success_count}/{len(icons)} icons to {OUTPUT_DIR}")
+    if duplicate_count:
+        print(f"Skipped {duplicate_count} icons whose filename is reused by a later icon")
+    if unchanged_count:
+        print(f"Skipped {unchanged_count} unchanged icons")
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -258,7 +504,7 @@ def main():
         print(f"  ... and {len(icons) - 10} more")
     
     # Export icons
-    export_icons(FILE_KEY, icons)
+    asyncio.run(export_icons(FILE_KEY, icons))
 
 
 if __name__ == "__main__":
@@ -10,10 +10,16 @@ Converts raw SVG icons to canonical format:
 - Sets stroke-based icon attributes
 
 Equivalent to the SVGO config provided.
+
+Unchanged inputs are skipped using icons/canonical/.manifest.json; delete it
+to force a full rebuild (e.g. after changing normalize_svg).
 """
 
 import os
 import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -23,6 +29,12 @@ from pathlib import Path
 SRC = Path(__file__).parent.parent / "icons" / "raw"
 OUT = Path(__file__).parent.parent / "icons" / "canonical"
 
+# Records the mtime and sha256 of each input at the time it was normalized
+MANIFEST = OUT / ".manifest.json"
+
+# Number of threads writing normalized files while workers keep normalizing
+WRITE_WORKERS = 16
+
 # Canonical SVG attributes for stroke-based icons
 CANONICAL_ATTRS = {
     "width": "24",
@@ -39,7 +51,41 @@ CANONICAL_ATTRS = {
 # SVG PROCESSING
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def normalize_svg(svg_content: str) -> str:
+# Patterns are compiled once at import; normalize_svg runs them on every file.
+# They are bytes patterns: the whole pipeline works on the raw file bytes,
+# so nothing is decoded or re-encoded along the way.
+_RE_XML_DECL = re.compile(rb'<\?xml[^?]*\?>\s*')
+_RE_DOCTYPE = re.compile(rb'<!DOCTYPE[^>]*>\s*', re.IGNORECASE)
+_RE_COMMENT = re.compile(rb'<!--.*?-->', re.DOTALL)
+_RE_VIEWBOX = re.compile(rb'viewBox=["\']([^"\']+)["\']')
+_RE_SVG = re.compile(rb'<svg([^>]*)>(.*)</svg>', re.DOTALL | re.IGNORECASE)
+# fill/stroke colors (group 1 set) and color-setting style attributes in one pass
+_RE_COLOR = re.compile(
+    rb'(fill|stroke)=["\'](?!none)[^"\']*["\']'
+    rb'|style=["\'][^"\']*(?:fill|stroke):[^"\']*["\']'
+)
+_RE_WS = re.compile(rb'\s+')
+_RE_GAP = re.compile(rb'>\s+<')
+
+# Canonical root tag, built once from CANONICAL_ATTRS; only viewBox varies per file
+_CANON_PREFIX = (
+    f'<svg width="{CANONICAL_ATTRS["width"]}" height="{CANONICAL_ATTRS["height"]}" '
+    f'viewBox="%s" stroke="{CANONICAL_ATTRS["stroke"]}" '
+    f'stroke-width="{CANONICAL_ATTRS["stroke-width"]}" '
+    f'stroke-linecap="{CANONICAL_ATTRS["stroke-linecap"]}" '
+    f'stroke-linejoin="{CANONICAL_ATTRS["stroke-linejoin"]}" '
+    f'fill="{CANONICAL_ATTRS["fill"]}">'
+).encode()
+_DEFAULT_VIEWBOX = CANONICAL_ATTRS["viewBox"].encode()
+
+
+def _sub_color(match: re.Match) -> bytes:
+    """Map a _RE_COLOR match to currentColor, or drop a color style attribute."""
+    attr = match.group(1)
+    return attr + b'="currentColor"' if attr else b''
+
+
+def normalize_svg(svg_content: bytes) -> bytes:
     """
     Normalize an SVG to canonical format.
     
@@ -54,69 +100,90 @@ def normalize_svg(svg_content: str) -> str:
     """
     
     # Remove XML declaration
-    svg_content = re.sub(r'<\?xml[^?]*\?>\s*', '', svg_content)
+    svg_content = _RE_XML_DECL.sub(b'', svg_content)
     
     # Remove doctype
-    svg_content = re.sub(r'<!DOCTYPE[^>]*>\s*', '', svg_content, flags=re.IGNORECASE)
+    svg_content = _RE_DOCTYPE.sub(b'', svg_content)
     
     # Remove comments
-    svg_content = re.sub(r'<!--.*?-->', '', svg_content, flags=re.DOTALL)
+    svg_content = _RE_COMMENT.sub(b'', svg_content)
     
-    # Extract existing viewBox if present
-    viewbox_match = re.search(r'viewBox=["\']([^"\']+)["\']', svg_content)
+    # Split the root <svg> tag into its attributes and inner content in one scan
+    svg_match = _RE_SVG.search(svg_content)
+    root_attrs = svg_match.group(1) if svg_match else b""
+    inner_content = svg_match.group(2).strip() if svg_match else b""
+    
+    # Extract existing viewBox from the root tag only, so a nested
+    # <svg>/<symbol> viewBox is never mistaken for the icon's own
+    viewbox_match = _RE_VIEWBOX.search(root_attrs)
     original_viewbox = viewbox_match.group(1) if viewbox_match else None
     
-    # Extract the SVG content (everything between <svg> tags)
-    inner_match = re.search(r'<svg[^>]*>(.*)</svg>', svg_content, flags=re.DOTALL | re.IGNORECASE)
-    inner_content = inner_match.group(1).strip() if inner_match else ""
-    
-    # Process inner content - convert colors to currentColor
-    # Replace fill="color" with fill="currentColor" (except fill="none")
-    inner_content = re.sub(
-        r'fill=["\'](?!none)[^"\']*["\']',
-        'fill="currentColor"',
-        inner_content
-    )
-    
-    # Replace stroke="color" with stroke="currentColor" (except stroke="none")  
-    inner_content = re.sub(
-        r'stroke=["\'](?!none)[^"\']*["\']',
-        'stroke="currentColor"',
-        inner_content
-    )
-    
-    # Remove any style attributes that set colors
-    inner_content = re.sub(
-        r'style=["\'][^"\']*(?:fill|stroke):[^"\']*["\']',
-        '',
-        inner_content
-    )
+    # Process inner content - convert colors to currentColor in a single pass:
+    # fill="color"/stroke="color" become currentColor (except "none"), and
+    # any style attributes that set colors are removed
+    inner_content = _RE_COLOR.sub(_sub_color, inner_content)
     
     # Build canonical SVG
     # Use original viewBox if it exists and looks valid, otherwise use default
-    viewbox = original_viewbox if original_viewbox else CANONICAL_ATTRS["viewBox"]
-    
-    attrs = [
-        f'width="{CANONICAL_ATTRS["width"]}"',
-        f'height="{CANONICAL_ATTRS["height"]}"',
-        f'viewBox="{viewbox}"',
-        f'stroke="{CANONICAL_ATTRS["stroke"]}"',
-        f'stroke-width="{CANONICAL_ATTRS["stroke-width"]}"',
-        f'stroke-linecap="{CANONICAL_ATTRS["stroke-linecap"]}"',
-        f'stroke-linejoin="{CANONICAL_ATTRS["stroke-linejoin"]}"',
-        f'fill="{CANONICAL_ATTRS["fill"]}"',
-    ]
+    viewbox = original_viewbox if original_viewbox else _DEFAULT_VIEWBOX
     
-    canonical_svg = f'<svg {" ".join(attrs)}>{inner_content}</svg>'
+    canonical_svg = _CANON_PREFIX % viewbox + inner_content + b'</svg>'
     
     # Clean up whitespace
-    canonical_svg = re.sub(r'\s+', ' ', canonical_svg)
-    canonical_svg = re.sub(r'>\s+<', '><', canonical_svg)
+    canonical_svg = _RE_WS.sub(b' ', canonical_svg)
+    canonical_svg = _RE_GAP.sub(b'><', canonical_svg)
     canonical_svg = canonical_svg.strip()
     
     return canonical_svg
 
 
+def _process_one(svg_path: Path) -> tuple[str, bytes | None, str | None]:
+    """
+    Normalize a single SVG file.
+    
+    Runs in a worker process; the write happens back in the main process.
+    Returns (filename, normalized SVG or None, error message or None).
+    """
+    filename = svg_path.name
+    
+    try:
+        # Read input
+        svg_content = svg_path.read_bytes()
+        
+        # Normalize
+        normalized = normalize_svg(svg_content)
+        
+    except Exception as e:
+        return filename, None, str(e)
+    
+    return filename, normalized, None
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    """
+    Write bytes to a file with raw os-level calls.
+    
+    Skips the buffered file object Path.write_bytes builds around every
+    open, which is pure overhead for hundreds of small single-shot writes.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def load_manifest() -> dict:
+    """Load the input manifest from the last run, or an empty one."""
+    try:
+        return json.loads(MANIFEST.read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
 def process_icons():
     """Process all SVG files in the source directory."""
     
@@ -145,30 +212,72 @@ def process_icons():
     
     success_count = 0
     error_count = 0
+    skipped_count = 0
+    
+    # Skip inputs that haven't changed since their output was written:
+    # a matching mtime is enough, otherwise fall back to the content hash
+    manifest = load_manifest()
+    new_manifest = {}
+    pending = []
     
     for svg_path in sorted(svg_files):
         filename = svg_path.name
+        entry = manifest.get(filename)
+        output_exists = (OUT / filename).exists()
+        mtime = svg_path.stat().st_mtime
         
-        try:
-            # Read input
-            svg_content = svg_path.read_text(encoding='utf-8')
-            
-            # Normalize
-            normalized = normalize_svg(svg_content)
-            
-            # Write output
-            output_path = OUT / filename
-            output_path.write_text(normalized, encoding='utf-8')
-            
-            print(f"✓ {filename}")
-            success_count += 1
+        if entry and output_exists and entry.get("mtime") == mtime:
+            new_manifest[filename] = entry
+            skipped_count += 1
+            continue
+        
+        digest = hashlib.sha256(svg_path.read_bytes()).hexdigest()
+        
+        if entry and output_exists and entry.get("sha256") == digest:
+            new_manifest[filename] = {"mtime": mtime, "sha256": digest}
+            skipped_count += 1
+            continue
+        
+        pending.append((svg_path, {"mtime": mtime, "sha256": digest}))
+    
+    # Files are independent and normalization is CPU-bound, so fan out
+    # across processes to use every core. Writes are handed to a thread
+    # pool as results arrive, overlapping disk I/O with normalization.
+    writes = []
+    if pending:
+        with ProcessPoolExecutor() as executor, ThreadPoolExecutor(max_workers=WRITE_WORKERS) as writer:
+            paths = [svg_path for svg_path, _ in pending]
+            results = executor.map(_process_one, paths, chunksize=16)
             
+            for (_, entry), (filename, normalized, error) in zip(pending, results):
+                if error is not None:
+                    print(f"✗ {filename}: {error}")
+                    error_count += 1
+                    continue
+                
+                output_path = OUT / filename
+                future = writer.submit(_write_file, output_path, normalized)
+                writes.append((filename, entry, future))
+    
+    for filename, entry, future in writes:
+        try:
+            future.result()
         except Exception as e:
             print(f"✗ {filename}: {e}")
             error_count += 1
+            continue
+        
+        print(f"✓ {filename}")
+        new_manifest[filename] = entry
+        success_count += 1
+    
+    # Only inputs that still exist and normalized cleanly are recorded
+    MANIFEST.write_text(json.dumps(new_manifest, indent=2, sort_keys=True), encoding='utf-8')
     
     print()
     print(f"Processed {success_count} icons successfully")
+    if skipped_count:
+        print(f"Skipped {skipped_count} unchanged icons")
     if error_count:
         print(f"Errors: {error_count}")
 